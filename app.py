@@ -2,11 +2,16 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 from src.document_processor import DocumentProcessor
-from src.vector_store import FinancialVectorStore
+from src.vector_store import FinancialVectorStore, HNSW_PRESETS
 from src.llm_chain import FinancialAnalystChain
+from src.query_cache import QueryCache
+from src.keywords import COMPANY_KEYWORDS, METRICS, extract_company_name
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from typing import Dict, List
 import traceback  # ← Already imported here, don't import again
-import shutil  # ← Add this here too
+import shutil
 
 load_dotenv()
 
@@ -21,42 +26,64 @@ st.set_page_config(
 # HELPER FUNCTIONS
 # ============================================
 
-def extract_company_name(filename: str) -> str:
-    """Extract company name from filename intelligently"""
-    name = filename.replace('.pdf', '').replace('.PDF', '')
-    
-    company_keywords = {
-        'TESLA': 'Tesla', 'TSLA': 'Tesla',
-        'NVIDIA': 'Nvidia', 'NVDA': 'Nvidia',
-        'APPLE': 'Apple', 'AAPL': 'Apple',
-        'MICROSOFT': 'Microsoft', 'MSFT': 'Microsoft',
-        'GOOGLE': 'Google', 'GOOGL': 'Google',
-        'AMAZON': 'Amazon', 'AMZN': 'Amazon',
-        'META': 'Meta', 'FB': 'Meta',
+# PDF worker processes. Under Streamlit each worker re-imports this script as
+# __mp_main__ (Streamlit installs it as __main__), costing ~135 MB and ~1.7 s
+# per worker - too much for a 1 GB host. Files are still processed
+# concurrently; raise this on hosts with memory to spare.
+PDF_WORKERS = 1
+
+@st.cache_resource(show_spinner=False)
+def get_processor() -> DocumentProcessor:
+    """One DocumentProcessor (and text splitter) shared across reruns and sessions"""
+    return DocumentProcessor(num_workers=PDF_WORKERS)
+
+SAMPLE_FILES = [
+    ("data/10k_reports/10-K TESLA.pdf", "10-K", "Tesla"),
+    ("data/10k_reports/10-K APPLE.pdf", "10-K", "Apple"),
+    ("data/10k_reports/10-K NVIDIA.pdf", "10-K", "Nvidia"),
+    ("data/earnings_calls/EC-TESLA.pdf", "Earnings Call", "Tesla"),
+]
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache() -> QueryCache:
+    """
+    Answers shared by every session in this server process. Entries are keyed
+    by corpus fingerprint, so a session only ever hits answers computed from
+    exactly the documents it has loaded itself.
+    """
+    return QueryCache(
+        max_size=256,
+        entity_terms={keyword.lower(): company for keyword, company in COMPANY_KEYWORDS.items()},
+        metric_terms=METRICS
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_demo_chunks() -> Dict[str, List[Dict]]:
+    """
+    Chunks for the bundled demo PDFs, parsed once per server process.
+    Shared across sessions, so callers must treat them as read-only.
+    """
+    processor = get_processor()
+    return {
+        file_path: processor.process_document(file_path, doc_type, company, cache_chunks=True)
+        for file_path, doc_type, company in SAMPLE_FILES
+        if os.path.exists(file_path)
     }
-    
-    name_upper = name.upper()
-    for keyword, proper_name in company_keywords.items():
-        if keyword in name_upper:
-            return proper_name
-    
-    for separator in ['_', '-', ' ']:
-        if separator in name:
-            parts = name.split(separator)
-            skip_words = {'10K', '10-K', 'EC', 'AR', 'EARNINGS', 'CALL', 
-                         'REPORT', 'ANNUAL', 'Q1', 'Q2', 'Q3', 'Q4', 
-                         '2023', '2024', '2025', 'FY'}
-            
-            for part in parts:
-                part_clean = part.strip().upper()
-                if part_clean and part_clean not in skip_words:
-                    for keyword, proper_name in company_keywords.items():
-                        if keyword in part_clean:
-                            return proper_name
-                    return part.strip().title()
-    
-    first_word = name.split()[0].strip() if name.split() else name
-    return first_word.title()
+
+def process_uploaded_file(file, processor: DocumentProcessor) -> List[Dict]:
+    """Save an upload to a temp file and chunk it. Makes no st.* calls, so it can run in a worker thread."""
+    temp_path = f"temp_{file.name}"
+    try:
+        # Stream to disk in 1 MB blocks instead of materializing the upload
+        file.seek(0)
+        with open(temp_path, "wb") as f:
+            shutil.copyfileobj(file, f, length=1024 * 1024)
+        
+        company = extract_company_name(file.name)
+        return processor.process_document(temp_path, "Financial Report", company)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 # ============================================
 # SESSION STATE INITIALIZATION
@@ -78,10 +105,37 @@ if 'total_queries_asked' not in st.session_state:
     st.session_state.total_queries_asked = 0
 if 'session_start_time' not in st.session_state:
     st.session_state.session_start_time = datetime.now()
-if 'processed_chunks' not in st.session_state:
-    st.session_state.processed_chunks = []
 if 'loaded_file_names' not in st.session_state:
     st.session_state.loaded_file_names = set()
+if 'hnsw_preset' not in st.session_state:
+    st.session_state.hnsw_preset = "balanced"
+
+def _source_filename(source: str) -> str:
+    filename = os.path.basename(source)
+    return filename[5:] if filename.startswith('temp_') else filename
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def summarize_loaded_documents(_vector_store, collection_name: str, version: int) -> Dict:
+    """
+    Per-company / per-type chunk counts for the sidebar.
+    Cached on (collection, version), so reruns skip the scan until chunks are added.
+    """
+    # Metadata only: chunk texts (and embeddings) never cross the Chroma boundary
+    all_docs = _vector_store.vectorstore.get(include=["metadatas"])
+    if not all_docs or not all_docs.get('metadatas'):
+        return {}
+    
+    metadatas = all_docs['metadatas']
+    return {
+        'total': len(metadatas),
+        'companies': dict(Counter(m.get('company', 'Unknown') for m in metadatas)),
+        'doc_types': dict(Counter(m.get('type', 'Unknown') for m in metadatas)),
+        'sources': sorted({
+            _source_filename(m['source'])
+            for m in metadatas
+            if m.get('source', 'Unknown') != 'Unknown'
+        }),
+    }
 
 def check_rate_limit():
     """Rate limiting: 10 queries per hour"""
@@ -97,6 +151,39 @@ def check_rate_limit():
     st.session_state.total_queries_asked += 1
     return True
 
+def live_answer(placeholder):
+    """on_token callback that renders a streamed answer into a placeholder as it arrives"""
+    parts = []
+    def on_token(token: str):
+        parts.append(token)
+        placeholder.markdown("".join(parts) + "▌")
+    return on_token
+
+def run_analysis(query: str, force_companies=None, **kwargs):
+    """Answer from the shared cache when possible, otherwise rate-limit and run the chain"""
+    cache = get_answer_cache()
+    corpus = st.session_state.vector_store.fingerprint
+    
+    # Free-form questions may also hit on a paraphrase. Comparisons stay
+    # exact: their prompts differ only by metric and would look near-identical.
+    query_vector = None
+    if not force_companies:
+        query_vector = st.session_state.vector_store.embeddings.embed_query(query)
+    
+    result = cache.get(query, force_companies, query_vector, corpus)
+    if result is not None:
+        st.session_state.total_queries_asked += 1
+        return result
+    
+    if not check_rate_limit():
+        st.stop()
+    
+    result = st.session_state.qa_chain.analyze_query(
+        query, force_companies=force_companies, **kwargs
+    )
+    cache.put(query, result, force_companies, query_vector, corpus)
+    return result
+
 def main():
     # Header
     st.title("🤖 AI Financial Analyst Assistant")
@@ -112,6 +199,15 @@ def main():
         if st.session_state.loaded_file_names:
             st.info(f"📎 {len(st.session_state.loaded_file_names)} files currently loaded")
         
+        st.select_slider(
+            "Retrieval preset",
+            options=list(HNSW_PRESETS),
+            key="hnsw_preset",
+            disabled=st.session_state.vector_store is not None,
+            help="Speed/accuracy trade-off of the vector index. "
+                 "Applies when documents are first loaded (use Start New Analysis to change)."
+        )
+        
         uploaded_files = st.file_uploader(
             "Upload Financial Documents (PDF)",
             type=['pdf'],
@@ -123,14 +219,16 @@ def main():
             if st.button("Process Documents", type="primary"):
                 with st.spinner("📄 Processing documents..."):
                     try:
-                        processor = DocumentProcessor()
+                        processor = get_processor()
                         all_chunks = []
                         processed_files = []
                         failed_files = []
                         skipped_files = []
                         
+                        eligible_files = []
                         for file in uploaded_files:
-                            if file.name in st.session_state.loaded_file_names:
+                            if (file.name in st.session_state.loaded_file_names
+                                    or any(f.name == file.name for f in eligible_files)):
                                 skipped_files.append(file.name)
                                 continue
                             
@@ -138,41 +236,58 @@ def main():
                                 failed_files.append((file.name, "File too large"))
                                 continue
                             
-                            try:
-                                temp_path = f"temp_{file.name}"
-                                with open(temp_path, "wb") as f:
-                                    f.write(file.getbuffer())
-                                
-                                company = extract_company_name(file.name)
-                                chunks = processor.process_document(
-                                    temp_path, "Financial Report", company
-                                )
+                            eligible_files.append(file)
+                        
+                        if eligible_files:
+                            # Files are independent: overlap their disk I/O and hashing,
+                            # while text extraction shares the processor's worker pool
+                            progress = st.progress(0.0, text="Extracting text...")
+                            max_workers = min(len(eligible_files), os.cpu_count() or 1)
+                            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                                futures = [
+                                    executor.submit(process_uploaded_file, file, processor)
+                                    for file in eligible_files
+                                ]
+                                for done, _ in enumerate(as_completed(futures), 1):
+                                    progress.progress(
+                                        done / len(futures),
+                                        text=f"Processed {done}/{len(futures)} files"
+                                    )
+                            progress.empty()
+                            
+                            # Aggregate in upload order so chunk order doesn't depend on timing
+                            for file, future in zip(eligible_files, futures):
+                                error = future.exception()
+                                if error is not None:
+                                    failed_files.append((file.name, str(error)))
+                                    continue
                                 
+                                chunks = future.result()
                                 if chunks:
                                     all_chunks.extend(chunks)
                                     processed_files.append(file.name)
-                                    st.session_state.loaded_file_names.add(file.name)
                                 else:
                                     failed_files.append((file.name, "No text extracted"))
-                                
-                                os.remove(temp_path)
-                            except Exception as e:
-                                failed_files.append((file.name, str(e)))
-                        
-                        if all_chunks:
-                            st.session_state.processed_chunks.extend(all_chunks)
                         
                         # Document upload section
-                        if st.session_state.processed_chunks:
+                        if all_chunks:
                             with st.spinner("🔢 Building vector database..."):
-                                # ← SIMPLIFIED: No disk cleanup needed
-                                vector_store = FinancialVectorStore()
-                                vector_store.create_vectorstore(st.session_state.processed_chunks)
-                                st.session_state.vector_store = vector_store
-                                st.session_state.qa_chain = FinancialAnalystChain(vector_store)
+                                # Embed only this batch's chunks, in one call
+                                if st.session_state.vector_store is None:
+                                    vector_store = FinancialVectorStore(st.session_state.hnsw_preset)
+                                    vector_store.create_vectorstore(all_chunks)
+                                    added = vector_store.count()
+                                    st.session_state.vector_store = vector_store
+                                    st.session_state.qa_chain = FinancialAnalystChain(vector_store)
+                                else:
+                                    # Chunks already in the store are skipped, not re-embedded
+                                    added = st.session_state.vector_store.add_documents(all_chunks)
+                                # Only now are these files really loaded
+                                st.session_state.loaded_file_names.update(processed_files)
                                 
-                                st.write(f"✓ Vector store created with {len(st.session_state.processed_chunks)} chunks")
-                            
+                                st.write(f"✓ Vector store updated with {added} new chunks")
+                        
+                        if st.session_state.vector_store:
                             if processed_files:
                                 st.session_state.total_documents_processed += len(processed_files)
                                 st.success(f"✅ Processed {len(processed_files)} new documents!")
@@ -186,7 +301,7 @@ def main():
                                     st.write("\n**Already loaded:**")
                                     for f in skipped_files:
                                         st.write(f"↻ {f}")
-                                st.caption(f"Total: {len(st.session_state.processed_chunks)} chunks")
+                                st.caption(f"Total: {st.session_state.vector_store.count()} chunks")
                         
                         if failed_files:
                             st.warning(f"⚠️ Failed: {len(failed_files)} files")
@@ -203,45 +318,37 @@ def main():
         if st.button("Load Samples"):
             with st.spinner("Loading demo documents..."):
                 try:
-                    sample_files = [
-                        ("data/10k_reports/10-K TESLA.pdf", "10-K", "Tesla"),
-                        ("data/10k_reports/10-K APPLE.pdf", "10-K", "Apple"),
-                        ("data/10k_reports/10-K NVIDIA.pdf", "10-K", "Nvidia"),
-                        ("data/earnings_calls/EC-TESLA.pdf", "Earnings Call", "Tesla"),
-                    ]
-                    
-                    processor = DocumentProcessor()
+                    demo_chunks = get_demo_chunks()
                     all_chunks = []
-                    loaded_count = 0
-                    
-                    for file_path, doc_type, company in sample_files:
-                        if os.path.exists(file_path):
-                            filename = os.path.basename(file_path)
-                            
-                            if filename in st.session_state.loaded_file_names:
-                                continue
-                            
-                            chunks = processor.process_document(file_path, doc_type, company)
-                            all_chunks.extend(chunks)
-                            loaded_count += 1
-                            st.session_state.loaded_file_names.add(filename)
+                    loaded_names = []
                     
-                    if all_chunks:
-                        st.session_state.processed_chunks.extend(all_chunks)
+                    for file_path, chunks in demo_chunks.items():
+                        filename = os.path.basename(file_path)
+                        
+                        if filename in st.session_state.loaded_file_names:
+                            continue
+                        
+                        all_chunks.extend(chunks)
+                        loaded_names.append(filename)
                     
                     # Demo documents section
-                    if st.session_state.processed_chunks:
-                        # ← SIMPLIFIED: No disk cleanup needed
-                        vector_store = FinancialVectorStore()
-                        vector_store.create_vectorstore(st.session_state.processed_chunks)
-                        st.session_state.vector_store = vector_store
-                        st.session_state.qa_chain = FinancialAnalystChain(vector_store)
-                        st.session_state.total_documents_processed += loaded_count
-                                
-                        if loaded_count > 0:
-                            st.success(f"✅ Loaded {loaded_count} new demo documents!")
+                    if all_chunks:
+                        # Embed only the newly loaded demo chunks. The store is per
+                        # session (it grows with uploads and is dropped on reset), so
+                        # it isn't shared via st.cache_resource; a rebuild in another
+                        # session reuses the parsed chunks and the on-disk embeddings.
+                        if st.session_state.vector_store is None:
+                            vector_store = FinancialVectorStore(st.session_state.hnsw_preset)
+                            vector_store.create_vectorstore(all_chunks, persist_embeddings=True)
+                            st.session_state.vector_store = vector_store
+                            st.session_state.qa_chain = FinancialAnalystChain(vector_store)
                         else:
-                            st.info("ℹ️ Demo documents already loaded")
+                            st.session_state.vector_store.add_documents(all_chunks, persist_embeddings=True)
+                        st.session_state.loaded_file_names.update(loaded_names)
+                        st.session_state.total_documents_processed += len(loaded_names)
+                        st.success(f"✅ Loaded {len(loaded_names)} new demo documents!")
+                    elif st.session_state.vector_store:
+                        st.info("ℹ️ Demo documents already loaded")
                     else:
                         st.warning("⚠️ No demo documents found")
                 except Exception as e:
@@ -254,43 +361,30 @@ def main():
             st.subheader("📚 Loaded Documents")
             
             try:
-                all_docs = st.session_state.vector_store.vectorstore.get()
+                vector_store = st.session_state.vector_store
+                summary = summarize_loaded_documents(
+                    vector_store, vector_store.collection_name, vector_store.version
+                )
                 
-                if all_docs and 'metadatas' in all_docs:
-                    companies = {}
-                    doc_types = {}
-                    sources = set()
-                    
-                    for metadata in all_docs['metadatas']:
-                        company = metadata.get('company', 'Unknown')
-                        doc_type = metadata.get('type', 'Unknown')
-                        source = metadata.get('source', 'Unknown')
-                        
-                        companies[company] = companies.get(company, 0) + 1
-                        doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
-                        
-                        if source != 'Unknown':
-                            filename = os.path.basename(source)
-                            if filename.startswith('temp_'):
-                                filename = filename[5:]
-                            sources.add(filename)
+                if summary:
+                    total = summary['total']
                     
                     st.markdown("**📊 By Company:**")
-                    for company, count in sorted(companies.items()):
-                        percentage = (count / len(all_docs['metadatas'])) * 100
+                    for company, count in sorted(summary['companies'].items()):
+                        percentage = (count / total) * 100
                         st.write(f"• **{company}**: {count} chunks ({percentage:.0f}%)")
                     
                     st.markdown("\n**📄 By Document Type:**")
-                    for dtype, count in sorted(doc_types.items()):
+                    for dtype, count in sorted(summary['doc_types'].items()):
                         st.write(f"• {dtype}: {count} chunks")
                     
-                    if sources:
+                    if summary['sources']:
                         with st.expander("📁 View Source Files"):
-                            for source in sorted(sources):
+                            for source in summary['sources']:
                                 st.caption(f"• {source}")
                     
                     st.markdown("---")
-                    st.info(f"**Total:** {len(all_docs['metadatas'])} chunks from {len(sources)} files")
+                    st.info(f"**Total:** {total} chunks from {len(summary['sources'])} files")
                 else:
                     st.info("✅ Documents loaded and ready")
             
@@ -303,6 +397,7 @@ def main():
         st.markdown("""
         **Technology:**
         - 🤖 GPT-4o-mini
+        - 🧩 FastEmbed (local embeddings)
         - 🗄️ ChromaDB
         - 🔗 LangChain
         - 📊 Streamlit
@@ -353,12 +448,10 @@ def main():
                 st.rerun()
         
         if analyze_button and user_query:
-            if not check_rate_limit():
-                st.stop()
-            
             with st.spinner("🧠 Analyzing..."):
+                answer_placeholder = st.empty()
                 try:
-                    result = st.session_state.qa_chain.analyze_query(user_query)
+                    result = run_analysis(user_query, on_token=live_answer(answer_placeholder))
                     st.session_state.chat_history.append({
                         "query": user_query,
                         "result": result,
@@ -367,6 +460,9 @@ def main():
                 except Exception as e:
                     st.error(f"❌ Error: {str(e)}")
                     st.error(traceback.format_exc())  # ← Fixed: no import statement
+                finally:
+                    # The finished answer is shown in the conversation history below
+                    answer_placeholder.empty()
                 
         # Add this RIGHT BEFORE the comparative analysis section in app.py:
 
@@ -382,10 +478,7 @@ def main():
                 st.write(f"**Test Query:** {test_query}")
                 
                 try:
-                    retriever = st.session_state.vector_store.vectorstore.as_retriever(
-                        search_kwargs={"k": 5}
-                    )
-                    docs = retriever.invoke(query)
+                    docs = st.session_state.vector_store.similarity_search(test_query, k=5)
                     
                     st.write(f"**Retrieved {len(docs)} documents:**")
                     for i, doc in enumerate(docs):
@@ -420,10 +513,7 @@ def main():
                 test_query = f"{company1} {company2} {metric}"
                 st.write(f"Query: `{test_query}`")
                 
-                retriever = st.session_state.vector_store.vectorstore.as_retriever(
-                    search_kwargs={"k": 10}
-                )
-                docs = retriever.invoke(test_query)
+                docs = st.session_state.vector_store.similarity_search(test_query, k=10)
                 
                 companies_found = {}
                 for doc in docs:
@@ -435,18 +525,16 @@ def main():
                 # Test 2: Separate searches (new way - shows the fix)
                 st.write("\n**Method 2: Separate Searches** (new way)")
                 
+                # One batched call for both companies; "Compare" reuses the result
+                company_docs = st.session_state.qa_chain.retrieve_company_docs(
+                    [company1, company2], metric
+                )
+                
                 all_docs = []
-                for company in [company1, company2]:
-                    st.write(f"\nSearching for: `{company} {metric}`")
-                    
-                    company_query = f"{company} {metric}"
-                    docs = retriever.invoke(company_query)
-
-                    # Filter to this company
-                    company_docs = [d for d in docs if d.metadata.get('company', '').lower() == company.lower()]
-                    all_docs.extend(company_docs[:5])
-                    
-                    st.write(f"✓ Found {len(company_docs)} documents from {company}")
+                for company, docs in company_docs.items():
+                    st.write(f"\nSearched for: `{company} {metric}`")
+                    all_docs.extend(docs)
+                    st.write(f"✓ Found {len(docs)} documents from {company}")
                 
                 # Summary
                 combined_companies = {}
@@ -458,17 +546,17 @@ def main():
                 st.success(f"✅ Both companies represented: {list(combined_companies.keys())}")
 
             if st.button("⚖️ Compare"):
-                if not check_rate_limit():
-                    st.stop()
-                
                 query = f"Compare {company1} and {company2} in terms of {metric}. Be specific."
                 
                 with st.spinner("Comparing..."):
+                    answer_placeholder = st.empty()
                     try:
                         # ← CRITICAL: Pass companies for forced balanced retrieval
-                        result = st.session_state.qa_chain.analyze_query(
+                        result = run_analysis(
                             query,
-                            force_companies=[company1, company2]
+                            force_companies=[company1, company2],
+                            topic=metric,
+                            on_token=live_answer(answer_placeholder)
                         )
                         
                         st.session_state.chat_history.append({
@@ -482,9 +570,8 @@ def main():
                         st.error(traceback.format_exc())
         
         # Display chat history
-        def format_timestamp(timestamp):
+        def format_timestamp(timestamp, now):
             try:
-                now = datetime.now()
                 diff = now - timestamp
                 seconds = diff.total_seconds()
                 
@@ -505,10 +592,13 @@ def main():
             st.markdown("---")
             st.subheader("📜 Conversation History")
             
+            # One clock read per render, shared by every message
+            now = datetime.now()
+            
             for i, chat in enumerate(reversed(st.session_state.chat_history)):
                 with st.container():
                     timestamp = chat['timestamp']
-                    time_str = format_timestamp(timestamp)
+                    time_str = format_timestamp(timestamp, now)
                     
                     col1, col2 = st.columns([4, 1])
                     with col1:
@@ -533,21 +623,25 @@ def main():
             col1, col2 = st.columns(2)
             
             with col1:
-                report = "AI FINANCIAL ANALYST - CONVERSATION REPORT\n"
-                report += "=" * 60 + "\n\n"
-                report += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                report += f"Total Questions: {len(st.session_state.chat_history)}\n\n"
+                # Collect pieces and join once; the report is rebuilt on every rerun
+                parts = [
+                    "AI FINANCIAL ANALYST - CONVERSATION REPORT\n",
+                    "=" * 60 + "\n\n",
+                    f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+                    f"Total Questions: {len(st.session_state.chat_history)}\n\n",
+                ]
                 
                 for i, chat in enumerate(st.session_state.chat_history):
                     ts = chat['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-                    report += f"\n{'='*60}\n"
-                    report += f"QUESTION {i+1} (Asked at: {ts})\n"
-                    report += f"{'='*60}\n\n"
-                    report += f"Q: {chat['query']}\n\n"
-                    report += f"A: {chat['result']['answer']}\n\n"
-                    report += "SOURCES:\n"
+                    parts.append(f"\n{'='*60}\n")
+                    parts.append(f"QUESTION {i+1} (Asked at: {ts})\n")
+                    parts.append(f"{'='*60}\n\n")
+                    parts.append(f"Q: {chat['query']}\n\n")
+                    parts.append(f"A: {chat['result']['answer']}\n\n")
+                    parts.append("SOURCES:\n")
                     for j, source in enumerate(chat['result']['sources']):
-                        report += f"\nSource {j+1}:\n{source['content']}\n"
+                        parts.append(f"\nSource {j+1}:\n{source['content']}\n")
+                report = "".join(parts)
                 
                 st.download_button(
                     "📥 Download Report",
@@ -559,11 +653,14 @@ def main():
             with col2:
                 # Start New Analysis button
                 if st.button("🔄 Start New Analysis"):
+                    if st.session_state.vector_store:
+                        # Drop this session's answers from the shared cache too
+                        get_answer_cache().discard_corpus(st.session_state.vector_store.fingerprint)
+                        st.session_state.vector_store.clear()
                     st.session_state.vector_store = None
                     st.session_state.qa_chain = None
                     st.session_state.chat_history = []
                     st.session_state.query_count = 0
-                    st.session_state.processed_chunks = []
                     st.session_state.loaded_file_names = set()
                     
                     # ← NO DISK CLEANUP NEEDED
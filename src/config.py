@@ -0,0 +1,31 @@
+# src/config.py
+import os
+import streamlit as st
+
+_openai_api_key = None
+
+
+def get_openai_api_key() -> str:
+    """
+    OpenAI API key from Streamlit secrets or the environment, resolved once.
+
+    Resolved on first use rather than at import time, because app.py loads
+    .env after importing src. The key is also exported to OPENAI_API_KEY for
+    clients that read it from the environment (the OpenAI embeddings).
+    """
+    global _openai_api_key
+    if _openai_api_key is None:
+        try:
+            api_key = st.secrets["OPENAI_API_KEY"]
+        except (KeyError, FileNotFoundError):
+            api_key = os.getenv("OPENAI_API_KEY")
+
+        if not api_key:
+            raise ValueError(
+                "OpenAI API key not found. "
+                "Set OPENAI_API_KEY in .env or Streamlit secrets."
+            )
+
+        os.environ["OPENAI_API_KEY"] = api_key
+        _openai_api_key = api_key
+    return _openai_api_key
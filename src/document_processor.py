@@ -1,38 +1,156 @@
 # src/document_processor.py
-import PyPDF2
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import pypdfium2 as pdfium
+from blake3 import blake3
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from typing import List, Dict
+from pathlib import Path
+from typing import List, Dict, Tuple
+
+# Below this many pages a PDF isn't worth splitting across workers
+MIN_PAGES_FOR_PARALLEL = 8
+
+# PDFium is not thread-safe: serialize every use of it in this process
+# (worker processes are single-threaded and don't need it)
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _extract_page_range(args: Tuple[str, int, int]) -> str:
+    """Extract text from pages [start, stop) of a PDF (runs in a worker process)"""
+    pdf_path, start, stop = args
+    # PDFium handles aren't picklable or thread-safe, so each worker opens its own
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        texts = []
+        for i in range(start, stop):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    # PDFium emits CRLF line breaks; the splitter separators expect "\n"
+    return "\n".join(texts).replace("\r\n", "\n")
+
 
 class DocumentProcessor:
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 num_workers: int = min(os.cpu_count() or 1, 4)):
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             separators=["\n\n", "\n", " ", ""]
         )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.num_workers = num_workers
+        self._chunk_cache_dir = Path(".chunk_cache")
+        # One pool shared by every caller, so documents processed concurrently
+        # queue behind num_workers processes instead of each forking their own
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # Forking the multi-threaded Streamlit server can deadlock the
+                # children on locks held by other threads; forkserver starts
+                # workers from a clean single-threaded process instead. Each
+                # worker still re-imports the caller's __main__ script (under
+                # Streamlit, app.py), so scripts need a __main__ guard and the
+                # app runs with num_workers=1 (see PDF_WORKERS in app.py)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context("forkserver")
+                )
+            return self._executor
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF file"""
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-        return text
+        """Extract text from PDF file, spreading pages across worker processes"""
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_path)
+            num_pages = len(pdf)
+            pdf.close()
+
+            if self.num_workers <= 1:
+                return _extract_page_range((pdf_path, 0, num_pages))
+
+        # One contiguous page range per worker: each worker parses the file
+        # once, and only num_workers strings are ever buffered at a time
+        num_ranges = self.num_workers if num_pages >= MIN_PAGES_FOR_PARALLEL else 1
+        step = max(-(-num_pages // num_ranges), 1)
+        ranges = [
+            (pdf_path, start, min(start + step, num_pages))
+            for start in range(0, num_pages, step)
+        ]
+        executor = self._get_executor()
+        try:
+            futures = [executor.submit(_extract_page_range, r) for r in ranges]
+            return "\n".join(f.result() for f in futures)
+        except BrokenProcessPool:
+            # A crashed worker poisons the pool; start fresh on the next call
+            with self._executor_lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
 
     def create_chunks(self, text: str, metadata: Dict) -> List[Dict]:
         """Split text into chunks with metadata"""
         chunks = self.text_splitter.split_text(text)
+        # dict(base, chunk_id=i) is a single C-level copy; Chroma needs full
+        # metadata on every row, so each chunk still gets its own dict
         return [
             {
                 "content": chunk,
-                "metadata": {**metadata, "chunk_id": i}
+                "metadata": dict(metadata, chunk_id=i)
             }
             for i, chunk in enumerate(chunks)
         ]
 
-    def process_document(self, file_path: str, doc_type: str, company: str) -> List[Dict]:
-        """Main processing pipeline"""
-        text = self.extract_text_from_pdf(file_path)
+    def _cache_key(self, file_path: str) -> str:
+        """Content address of a PDF plus the splitter settings that shaped its chunks"""
+        hasher = blake3()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                hasher.update(block)
+        return f"{hasher.hexdigest()}_{self.chunk_size}_{self.chunk_overlap}"
+
+    def process_document(self, file_path: str, doc_type: str, company: str,
+                         cache_chunks: bool = False) -> List[Dict]:
+        """
+        Main processing pipeline, skipped entirely for PDFs already in the chunk cache.
+        Only pass cache_chunks=True for bundled documents: it writes the full
+        text to .chunk_cache/, and uploads must never be kept on disk.
+        """
         metadata = {"source": file_path, "type": doc_type, "company": company}
-        return self.create_chunks(text, metadata)
+        if not cache_chunks:
+            # Uploads never reach the cache, so don't read and hash them for it
+            return self.create_chunks(self.extract_text_from_pdf(file_path), metadata)
+
+        cache_path = self._chunk_cache_dir / f"{self._cache_key(file_path)}.pkl"
+        if cache_path.exists():
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            # Same bytes may arrive under a different name/type/company
+            return [
+                {"content": c["content"], "metadata": dict(c["metadata"], **metadata)}
+                for c in cached
+            ]
+
+        text = self.extract_text_from_pdf(file_path)
+        chunks = self.create_chunks(text, metadata)
+
+        # Write-then-rename so an interrupted run never leaves a torn pickle
+        self._chunk_cache_dir.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._chunk_cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(chunks, f)
+        os.replace(tmp_path, cache_path)
+        return chunks
+
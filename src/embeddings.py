@@ -0,0 +1,186 @@
+# src/embeddings.py
+from langchain_community.embeddings import FastEmbedEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from blake3 import blake3
+from contextlib import closing
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+import os
+import sqlite3
+import streamlit as st
+from src.http_clients import OPENAI_MAX_RETRIES, http_client
+
+# "fastembed" embeds locally with an INT8-quantized ONNX model (no API calls);
+# "openai" uses the hosted API. Documents and queries must use the same one.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "fastembed").lower()
+
+FASTEMBED_MODEL = "BAAI/bge-small-en-v1.5"  # 384-dim, quantized ONNX build
+FASTEMBED_BATCH_SIZE = 64
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"  # Cost-effective embedding model
+# Shortened from 1536 dims: 3x less index memory and distance work for ~1% retrieval quality
+OPENAI_EMBEDDING_DIMENSIONS = 512
+
+# Per-request limits of the OpenAI embeddings endpoint
+EMBEDDING_BATCH_SIZE = 2048
+EMBEDDING_BATCH_TOKENS = 300_000
+
+# Embedding requests in flight at once during ingest (FinancialVectorStore._insert)
+OPENAI_PARALLEL_REQUESTS = 4
+
+# Distinct query strings whose vectors are kept in memory
+QUERY_CACHE_SIZE = 1024
+
+# Chunk vectors persisted across restarts, keyed by blake3(model + text)
+EMBED_CACHE_PATH = Path(".embed_cache.db")
+
+# Keys per SELECT ... IN (...), well under SQLite's bound-parameter limit
+_SQLITE_BATCH = 500
+
+
+def _approx_tokens(text: str) -> int:
+    # English averages ~4 characters per token; assuming 3 overestimates on
+    # purpose, so a slice never exceeds the request's token limit
+    return len(text) // 3 + 1
+
+
+def embedding_slices(texts: List[str], max_items: int = EMBEDDING_BATCH_SIZE,
+                     max_tokens: int = EMBEDDING_BATCH_TOKENS) -> Iterator[List[str]]:
+    """Split texts into consecutive slices that each fit in one embeddings request"""
+    batch, tokens = [], 0
+    for text in texts:
+        cost = _approx_tokens(text)
+        if batch and (len(batch) == max_items or tokens + cost > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += cost
+    if batch:
+        yield batch
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that memoizes query vectors by (model, text) in memory
+    and document vectors on disk. Retrieval reuses fixed strings ("<company>
+    <topic>", the enhanced queries, repeated questions), and restarts re-ingest
+    the same chunks, so most embeddings skip the model entirely.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str,
+                 query_cache_size: int = QUERY_CACHE_SIZE,
+                 cache_path: Path = EMBED_CACHE_PATH,
+                 parallel_requests: int = 1):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = Path(cache_path)
+        # Batches the vector store embeds concurrently; >1 only for remote
+        # APIs, local models already use every core
+        self.parallel_requests = parallel_requests
+        self._cached_query = lru_cache(maxsize=query_cache_size)(self._embed_query)
+
+    def _embed_query(self, model_name: str, text: str) -> Tuple[float, ...]:
+        # Tuples keep cached vectors immutable; callers get a fresh list each time
+        return tuple(self.embeddings.embed_query(text))
+
+    def embed_query(self, text: str) -> List[float]:
+        return list(self._cached_query(self.model_name, text))
+
+    def embed_documents(self, texts: List[str], persist: bool = False) -> List[List[float]]:
+        """
+        Embed only the texts not already in the disk cache, then merge.
+        New vectors are written back only with persist=True (bundled documents);
+        vectors of uploaded documents stay in memory.
+        """
+        keys = [self._document_key(text) for text in texts]
+        vectors = self._load_cached(set(keys))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+
+        if missing:
+            # Round to float32 up front so hits and misses return identical vectors
+            fresh = np.asarray(self._embed_uncached(list(missing.values())), dtype=np.float32)
+            computed = dict(zip(missing, fresh))
+            if persist:
+                self._store(computed)
+            vectors.update(computed)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """One request per slice; callers run several batches concurrently (see parallel_requests)"""
+        return [v for s in embedding_slices(texts) for v in self.embeddings.embed_documents(s)]
+
+    def _document_key(self, text: str) -> str:
+        return blake3(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call; sessions embed from different threads
+        conn = sqlite3.connect(self.cache_path, timeout=30)
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        return conn
+
+    def _load_cached(self, keys: set) -> Dict[str, np.ndarray]:
+        found = {}
+        # Connecting would create the file; nothing is cached until a persist=True call
+        if not self.cache_path.exists():
+            return found
+        keys = list(keys)
+        with closing(self._connect()) as conn:
+            for i in range(0, len(keys), _SQLITE_BATCH):
+                batch = keys[i:i + _SQLITE_BATCH]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _store(self, vectors: Dict[str, np.ndarray]):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, v.tobytes()) for key, v in vectors.items()]
+            )
+
+
+@st.cache_resource(show_spinner=False)
+def get_embeddings(provider: str = EMBEDDING_PROVIDER) -> Embeddings:
+    """
+    Embeddings model shared by every vector store in this server process.
+    The OpenAI provider expects OPENAI_API_KEY in the environment before first use.
+    """
+    if provider == "fastembed":
+        return CachedEmbeddings(
+            FastEmbedEmbeddings(
+                model_name=FASTEMBED_MODEL,
+                batch_size=FASTEMBED_BATCH_SIZE,
+                providers=["CPUExecutionProvider"]
+            ),
+            FASTEMBED_MODEL
+        )
+
+    if provider == "openai":
+        return CachedEmbeddings(
+            OpenAIEmbeddings(
+                model=OPENAI_EMBEDDING_MODEL,
+                dimensions=OPENAI_EMBEDDING_DIMENSIONS,
+                chunk_size=EMBEDDING_BATCH_SIZE,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=http_client
+            ),
+            # Dimensions are part of the cache key; vectors of different sizes don't mix
+            f"{OPENAI_EMBEDDING_MODEL}@{OPENAI_EMBEDDING_DIMENSIONS}",
+            parallel_requests=OPENAI_PARALLEL_REQUESTS
+        )
+
+    raise ValueError(
+        f"Unknown EMBEDDING_PROVIDER '{provider}'. Use 'fastembed' or 'openai'."
+    )
@@ -0,0 +1,16 @@
+# src/http_clients.py
+import httpx
+
+# One keep-alive pool per process for every OpenAI call (chat and embeddings),
+# so bursts of concurrent requests reuse TLS connections instead of opening new ones
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+# Retries per OpenAI request on rate limits and transient errors
+OPENAI_MAX_RETRIES = 2
+
+http_client = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+# Only used from the chain's single background event loop (see src/llm_chain.py);
+# an AsyncClient's pool must not be shared across event loops
+http_async_client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
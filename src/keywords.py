@@ -0,0 +1,59 @@
+# src/keywords.py
+# Vocabulary shared by filename parsing and the answer cache
+import re
+
+COMPANY_KEYWORDS = {
+    'TESLA': 'Tesla', 'TSLA': 'Tesla',
+    'NVIDIA': 'Nvidia', 'NVDA': 'Nvidia',
+    'APPLE': 'Apple', 'AAPL': 'Apple',
+    'MICROSOFT': 'Microsoft', 'MSFT': 'Microsoft',
+    'GOOGLE': 'Google', 'GOOGL': 'Google',
+    'AMAZON': 'Amazon', 'AMZN': 'Amazon',
+    'META': 'Meta', 'FB': 'Meta',
+}
+
+# Financial metrics a question can ask about, matched as substrings so
+# "margins", "risks" and "profitability" count (order = retrieval query order)
+METRICS = ("revenue", "r&d", "margin", "profit", "risk", "growth")
+
+# Keywords this short turn up inside unrelated words, so they must stand alone
+SHORT_KEYWORD_LENGTH = 2
+
+
+def _keyword_pattern(keyword: str) -> str:
+    # Letter lookarounds rather than \b so "FB_10K" still matches ("_" is a word char)
+    if len(keyword) <= SHORT_KEYWORD_LENGTH:
+        return rf"(?<![A-Z]){re.escape(keyword)}(?![A-Z])"
+    # Names and tickers match anywhere, as in "AppleInc_10K" or "NVDAearnings"
+    return re.escape(keyword)
+
+
+# One C-level scan for every keyword
+_COMPANY_RE = re.compile(
+    "(" + "|".join(map(_keyword_pattern, COMPANY_KEYWORDS)) + ")",
+    re.IGNORECASE
+)
+
+
+def extract_company_name(filename: str) -> str:
+    """Extract company name from filename intelligently"""
+    name = filename.replace('.pdf', '').replace('.PDF', '')
+    
+    match = _COMPANY_RE.search(name)
+    if match:
+        return COMPANY_KEYWORDS[match.group(1).upper()]
+    
+    for separator in ['_', '-', ' ']:
+        if separator in name:
+            parts = name.split(separator)
+            skip_words = {'10K', '10-K', 'EC', 'AR', 'EARNINGS', 'CALL', 
+                         'REPORT', 'ANNUAL', 'Q1', 'Q2', 'Q3', 'Q4', 
+                         '2023', '2024', '2025', 'FY'}
+            
+            for part in parts:
+                part_clean = part.strip().upper()
+                if part_clean and part_clean not in skip_words:
+                    return part.strip().title()
+    
+    first_word = name.split()[0].strip() if name.split() else name
+    return first_word.title()
@@ -1,24 +1,51 @@
 # src/llm_chain.py - FIXED FOR STREAMLIT CLOUD
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from typing import Dict, List
-import os
+from langchain_core.caches import BaseCache, InMemoryCache
+from langchain_core.globals import get_llm_cache
+from langchain_core.documents import Document
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import zip_longest
+from typing import Callable, Dict, List
+import asyncio
+import queue
+import re
+import threading
+import tiktoken
+from src.config import get_openai_api_key
+from src.http_clients import OPENAI_MAX_RETRIES, http_async_client, http_client
+from src.keywords import METRICS
+from src.vector_store import company_filter, company_key
 
-class FinancialAnalystChain:
-    def __init__(self, vector_store, model_name: str = "gpt-4o-mini"):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found")
-        
-        self.llm = ChatOpenAI(
-            model_name=model_name,
-            temperature=0.1,
-            openai_api_key=api_key
-        )
-        self.vector_store = vector_store
-        
-        self.prompt = PromptTemplate.from_template(
-            """You are an expert financial analyst. Analyze the provided context from financial documents to answer the question thoroughly.
+# Default per-company search topic for forced (comparative) retrieval
+DEFAULT_COMPANY_TOPIC = "revenue financial performance"
+
+# Identical prompts answered from memory by this chain (i.e. this session)
+LLM_CACHE_SIZE = 128
+
+# Prompt tokens spent on retrieved documents; the LLM's latency and cost grow with it
+# (chunks average ~250 tokens, so this is a little under the old 15-chunk prompts)
+CONTEXT_TOKEN_BUDGET = 3500
+# Hard cap on documents per prompt, whatever their size
+MAX_CONTEXT_DOCS = 15
+# Allowance per document for its "[Document n - company - type]" header and separator
+DOC_HEADER_TOKENS = 20
+# A document cut shorter than this to fit the budget is left out instead
+MIN_TRUNCATED_TOKENS = 100
+
+# Keyword tables for _enhance_query_for_retrieval (order = output order)
+# "compar" also catches compared/comparing/comparison, as the old substring test did
+_COMPARE_PREFIX = "compar"
+_COMPARE_WORDS = frozenset({"versus", "vs"})
+_KNOWN_COMPANIES = ("Tesla", "Nvidia", "Apple", "Microsoft", "Google", "Amazon", "Meta")
+_WORD_RE = re.compile(r"[a-z&]+")
+
+# Static instruction block of the analysis prompt; only context and question vary
+PROMPT_HEAD = """You are an expert financial analyst. Analyze the provided context from financial documents to answer the question thoroughly.
 
 CRITICAL INSTRUCTIONS:
 1. **Use ALL relevant information from the context**
@@ -26,40 +53,170 @@ CRITICAL INSTRUCTIONS:
 3. **Cite specific numbers and data points**
 4. **Structure comparative answers** with clear sections for each company
 5. **If data is missing**: Explicitly state what's missing
-6. **Always attempt an answer** based on available context
+6. **Always attempt an answer** based on available context"""
+
+# Final step of a comparison: merges per-company analyses into one answer
+SYNTHESIS_PROMPT_HEAD = """You are an expert financial analyst. Below are separate analyses of each company, each written only from that company's financial documents. Combine them into one answer to the question.
+
+CRITICAL INSTRUCTIONS:
+1. **Structure the answer** with clear sections for each company
+2. **Keep the specific numbers and data points** from each analysis
+3. **Compare the companies directly** wherever the figures allow it
+4. **If data is missing**: Explicitly state what's missing"""
+
+# All chain coroutines run on one long-lived event loop in a daemon thread.
+# Async OpenAI/httpx clients bind their connection pools to the loop they
+# first ran on, so a fresh asyncio.run() per query would break them.
+_loop = None
+_loop_lock = threading.Lock()
+
+# Blocking work the loop hands off (Chroma searches, query embeddings) runs
+# here. Sized for a few concurrent sessions each fanning out over several
+# sub-queries, independent of the host's core count.
+_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="financial-analyst-io")
+
+
+def _submit(coro):
+    """Schedule a coroutine on the shared background loop; returns a concurrent Future"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop.set_default_executor(_POOL)
+            threading.Thread(
+                target=_loop.run_forever, name="financial-analyst-loop", daemon=True
+            ).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
+
+
+class _ApproxEncoding:
+    """Stand-in for a tiktoken encoding: ~4 characters per token"""
 
-CONTEXT FROM FINANCIAL DOCUMENTS:
-{context}
+    def encode(self, text: str) -> List[str]:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
 
-QUESTION: {question}
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
 
-DETAILED ANALYSIS:"""
+
+@lru_cache(maxsize=None)
+def _token_encoding(model_name: str):
+    """tiktoken encoding for a chat model, loaded once per process"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # The BPE file is downloaded on first use; without network access an
+        # estimate keeps budgeting working instead of failing every query
+        return _ApproxEncoding()
+
+
+def _run(coro):
+    """Run a coroutine on the shared background loop and wait for its result"""
+    return _submit(coro).result()
+
+
+class FinancialAnalystChain:
+    def __init__(self, vector_store, model_name: str = "gpt-4o-mini"):
+        self.model_name = model_name
+        self.llm = ChatOpenAI(
+            model_name=model_name,
+            temperature=0.1,
+            openai_api_key=get_openai_api_key(),
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            # Per-chain, in-memory only: prompts carry document text, so cached
+            # responses go away with the session's chain, never to disk
+            cache=InMemoryCache(maxsize=LLM_CACHE_SIZE)
+        )
+        self.vector_store = vector_store
+        # (store version, companies, topic) -> per-company docs, shared by
+        # "Test Retrieval" and "Compare" so the second click reuses the first
+        self._company_docs_cache = OrderedDict()
+    
+    def build_prompt(self, context: str, question: str) -> str:
+        """Full analysis prompt for one query"""
+        return (
+            f"{PROMPT_HEAD}\n\nCONTEXT FROM FINANCIAL DOCUMENTS:\n{context}"
+            f"\n\nQUESTION: {question}\n\nDETAILED ANALYSIS:"
+        )
+    
+    def build_synthesis_prompt(self, analyses: Dict[str, str], question: str) -> str:
+        """Prompt that merges per-company analyses into one comparative answer"""
+        sections = "\n\n---\n\n".join(
+            f"[{company}]:\n{analysis}" for company, analysis in analyses.items()
+        )
+        return (
+            f"{SYNTHESIS_PROMPT_HEAD}\n\nPER-COMPANY ANALYSES:\n{sections}"
+            f"\n\nQUESTION: {question}\n\nCOMPARATIVE ANALYSIS:"
         )
     
     def format_docs(self, docs):
         """Format retrieved documents with clear separation"""
-        formatted = []
-        for i, doc in enumerate(docs):
-            company = doc.metadata.get('company', 'Unknown')
-            doc_type = doc.metadata.get('type', 'Unknown')
-            formatted.append(f"[Document {i+1} - {company} - {doc_type}]:\n{doc.page_content}\n")
-        return "\n---\n".join(formatted)
+        return "\n---\n".join(
+            f"[Document {i} - {doc.metadata.get('company', 'Unknown')} - "
+            f"{doc.metadata.get('type', 'Unknown')}]:\n{doc.page_content}\n"
+            for i, doc in enumerate(docs, 1)
+        )
+    
+    def _truncate_to_sentence(self, text: str, max_tokens: int) -> str:
+        """First max_tokens tokens of text, cut back to the last sentence end when there is one"""
+        encoding = _token_encoding(self.model_name)
+        prefix = encoding.decode(encoding.encode(text)[:max_tokens])
+        cut = max(prefix.rfind(end) for end in (". ", "! ", "? ", "\n"))
+        return prefix[:cut + 1] if cut > 0 else prefix
+    
+    def select_context(self, docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET,
+                       max_docs: int = MAX_CONTEXT_DOCS) -> List[Document]:
+        """
+        Choose at most max_docs documents to send to the LLM within a token budget.
+        
+        Companies take turns (each in its own retrieval order), so one company
+        can't crowd out the others; the document that overflows the budget is
+        cut at a sentence boundary and ends the selection.
+        """
+        encoding = _token_encoding(self.model_name)
+        by_company = OrderedDict()
+        for doc in docs:
+            by_company.setdefault(doc.metadata.get("company", "Unknown"), []).append(doc)
+        
+        selected = []
+        remaining = budget
+        for round_docs in zip_longest(*by_company.values()):
+            for doc in round_docs:
+                if doc is None:
+                    continue
+                if len(selected) == max_docs:
+                    return selected
+                cost = len(encoding.encode(doc.page_content)) + DOC_HEADER_TOKENS
+                if cost <= remaining:
+                    selected.append(doc)
+                    remaining -= cost
+                    continue
+                
+                room = remaining - DOC_HEADER_TOKENS
+                if room >= MIN_TRUNCATED_TOKENS:
+                    selected.append(Document(
+                        page_content=self._truncate_to_sentence(doc.page_content, room),
+                        metadata=doc.metadata
+                    ))
+                return selected
+        return selected
     
     def _enhance_query_for_retrieval(self, query: str) -> List[str]:
         """Generate multiple search queries for better coverage"""
         queries = [query]
+        lowered = query.lower()
+        words = set(_WORD_RE.findall(lowered))
         
-        if any(word in query.lower() for word in ["compare", "versus", "vs"]):
-            companies = []
-            for word in ["Tesla", "Nvidia", "Apple", "Microsoft", "Google", "Amazon", "Meta"]:
-                if word.lower() in query.lower():
-                    companies.append(word)
+        if words & _COMPARE_WORDS or any(w.startswith(_COMPARE_PREFIX) for w in words):
+            companies = [c for c in _KNOWN_COMPANIES if c.lower() in words]
             
-            metric = ""
-            for m in ["revenue", "r&d", "margin", "profit", "risk", "growth"]:
-                if m in query.lower():
-                    metric = m
-                    break
+            # Substring match so "margins", "risks" and "profitability" still count
+            metric = next((m for m in METRICS if m in lowered), "")
             
             if len(companies) >= 2 and metric:
                 for company in companies:
@@ -67,60 +224,117 @@ DETAILED ANALYSIS:"""
         
         return queries
     
-    def analyze_query(self, query: str, force_companies: List[str] = None) -> Dict:
+    def retrieve_company_docs(self, companies: List[str],
+                              topic: str = DEFAULT_COMPANY_TOPIC) -> Dict[str, List]:
+        """
+        Retrieve up to 7 documents per company, one "<company> <topic>" search each.
+        
+        Each search is filtered to its company inside Chroma, the searches run
+        concurrently, and results are memoized until the vector store changes.
+        """
+        return _run(self.aretrieve_company_docs(companies, topic))
+    
+    async def aretrieve_company_docs(self, companies: List[str],
+                                     topic: str = DEFAULT_COMPANY_TOPIC) -> Dict[str, List]:
+        """Async version of retrieve_company_docs"""
+        key = (
+            self.vector_store.version,
+            tuple(company_key(c) for c in companies),
+            topic.lower(),
+        )
+        if key in self._company_docs_cache:
+            self._company_docs_cache.move_to_end(key)
+            return dict(zip(companies, self._company_docs_cache[key]))
+        
+        # Pre-filter in Chroma so all k results belong to each company;
+        # total latency is the slowest search, not the sum
+        results = await asyncio.gather(*(
+            self.vector_store.asimilarity_search(
+                f"{company} {topic}",
+                k=7,  # Max 7 per company
+                filter_dict=company_filter(company)
+            )
+            for company in companies
+        ))
+        
+        self._company_docs_cache[key] = results
+        while len(self._company_docs_cache) > 16:
+            self._company_docs_cache.popitem(last=False)
+        return dict(zip(companies, results))
+    
+    def analyze_query(self, query: str, force_companies: List[str] = None,
+                      topic: str = DEFAULT_COMPANY_TOPIC,
+                      on_token: Callable[[str], None] = None) -> Dict:
         """
-        Run analysis with optional forced balanced retrieval from specific companies
+        Run analysis with optional forced balanced retrieval from specific companies.
+        `topic` is the per-company search phrase used for forced retrieval.
+        If `on_token` is given, the answer is streamed to it as it is generated;
+        the full result is returned either way.
         """
+        if on_token is None:
+            return _run(self.analyze_query_async(query, force_companies, topic))
+        
+        # Tokens arrive on the loop thread but on_token must run on the
+        # caller's thread (Streamlit elements can't be updated from elsewhere)
+        tokens = queue.Queue()
+        future = _submit(self.analyze_query_async(query, force_companies, topic, tokens.put))
+        future.add_done_callback(lambda _: tokens.put(None))
+        for token in iter(tokens.get, None):
+            on_token(token)
+        return future.result()
+    
+    async def analyze_query_async(self, query: str, force_companies: List[str] = None,
+                                  topic: str = DEFAULT_COMPANY_TOPIC,
+                                  on_token: Callable[[str], None] = None) -> Dict:
+        """Async version of analyze_query; all retrievals for a query run concurrently"""
         try:
             all_docs = []
             
+            if force_companies:
+                # "Tesla" and "tesla" share chunks: keep the first spelling only,
+                # or the second would get an empty "no information" analysis
+                by_key = {}
+                for company in force_companies:
+                    by_key.setdefault(company_key(company), company)
+                force_companies = list(by_key.values())
+            
             # Force balanced retrieval for comparisons
             if force_companies and len(force_companies) >= 2:
                 seen_content = set()
                 
                 # Get documents from EACH company separately
+                company_docs = await self.aretrieve_company_docs(force_companies, topic)
+                unique_docs = {}
                 for company in force_companies:
-                    # Search with company-specific query
-                    company_query = f"{company} revenue financial performance"
-                    
-                    retriever = self.vector_store.vectorstore.as_retriever(
-                        search_kwargs={"k": 10}
-                    )
-                    # ← FIXED: Use invoke() instead of get_relevant_documents()
-                    docs = retriever.invoke(company_query)
-                    
-                    # Filter to only this company's docs
-                    company_docs = [
-                        d for d in docs 
-                        if d.metadata.get('company', '').lower() == company.lower()
-                    ]
-                    
                     # Add unique documents
-                    for doc in company_docs[:7]:  # Max 7 per company
-                        content_hash = hash(doc.page_content[:200])
+                    unique_docs[company] = []
+                    for doc in company_docs[company]:
+                        content_hash = doc.metadata["content_hash"]
                         if content_hash not in seen_content:
-                            all_docs.append(doc)
+                            unique_docs[company].append(doc)
                             seen_content.add(content_hash)
                 
+                return await self._compare_companies(query, unique_docs, on_token)
+            
             else:
                 # Normal retrieval
                 search_queries = self._enhance_query_for_retrieval(query)
                 seen_content = set()
                 
-                for search_query in search_queries:
-                    retriever = self.vector_store.vectorstore.as_retriever(
-                        search_kwargs={"k": 5}
-                    )
-                    # ← FIXED: Use invoke() instead of get_relevant_documents()
-                    docs = retriever.invoke(search_query)
-                    
+                # Direct searches: no retriever/Runnable config setup per call
+                docs_per_query = await asyncio.gather(
+                    *(self.vector_store.asimilarity_search(q, k=5) for q in search_queries)
+                )
+                
+                # Merge in query order so dedup keeps the original priority
+                for docs in docs_per_query:
                     for doc in docs:
-                        content_hash = hash(doc.page_content[:200])
+                        content_hash = doc.metadata["content_hash"]
                         if content_hash not in seen_content:
                             all_docs.append(doc)
                             seen_content.add(content_hash)
-                
-                all_docs = all_docs[:15]
+            
+            all_docs = self.select_context(all_docs)
             
             if not all_docs:
                 return {
@@ -132,28 +346,103 @@ DETAILED ANALYSIS:"""
             context = self.format_docs(all_docs)
             
             # Create prompt
-            formatted_prompt = self.prompt.format(
-                context=context,
-                question=query
-            )
+            formatted_prompt = self.build_prompt(context, query)
             
             # Get LLM response
-            response = self.llm.invoke(formatted_prompt)
+            answer = await self._generate(formatted_prompt, on_token)
             
-            return {
-                "answer": response.content,
-                "sources": [
-                    {
-                        "content": doc.page_content[:300] + "...",
-                        "metadata": doc.metadata
-                    }
-                    for doc in all_docs[:10]
-                ]
-            }
+            return self._result(answer, all_docs)
         
         except Exception as e:
             import traceback
             return {
                 "answer": f"Error: {str(e)}\n\n{traceback.format_exc()}",
                 "sources": []
-            }
\ No newline at end of file
+            }
+    
+    async def _generate(self, prompt: str, on_token: Callable[[str], None] = None) -> str:
+        """LLM answer for a prompt, streamed to on_token when given"""
+        if on_token is None:
+            return (await self.llm.ainvoke(prompt)).content
+        
+        # astream() never consults the model's response cache, so look up and
+        # store under the same key ainvoke() uses; a hit is replayed in one go.
+        # Same cache resolution as BaseChatModel: its own, else the global one.
+        cache = self.llm.cache if isinstance(self.llm.cache, BaseCache) else None
+        if cache is None and self.llm.cache is not False:
+            cache = get_llm_cache()
+        
+        if cache is not None:
+            cache_key = dumps(self.llm._convert_input(prompt).to_messages())
+            llm_string = self.llm._get_llm_string()
+            cached = await cache.alookup(cache_key, llm_string)
+            if cached:
+                answer = cached[0].text
+                on_token(answer)
+                return answer
+        
+        parts = []
+        async for chunk in self.llm.astream(prompt):
+            if chunk.content:
+                parts.append(chunk.content)
+                on_token(chunk.content)
+        answer = "".join(parts)
+        if cache is not None:
+            await cache.aupdate(cache_key, llm_string, [ChatGeneration(message=AIMessage(content=answer))])
+        return answer
+    
+    def _result(self, answer: str, docs: List[Document]) -> Dict:
+        return {
+            "answer": answer,
+            "sources": [
+                {
+                    "content": doc.page_content[:300] + "...",
+                    "metadata": doc.metadata
+                }
+                for doc in docs[:10]
+            ]
+        }
+    
+    async def _compare_companies(self, query: str, company_docs: Dict[str, List[Document]],
+                                 on_token: Callable[[str], None] = None) -> Dict:
+        """
+        Map-reduce comparison: one focused analysis per company, run concurrently
+        on just that company's documents, then a short synthesis of the results.
+        
+        Wall time is the slowest company plus the synthesis, and no company's
+        documents are sent alongside another's. The context budget and document
+        cap are split evenly so total input stays within the single-prompt limits.
+        """
+        budget = CONTEXT_TOKEN_BUDGET // len(company_docs)
+        max_docs = max(1, MAX_CONTEXT_DOCS // len(company_docs))
+        selected = {
+            company: self.select_context(docs, budget, max_docs)
+            for company, docs in company_docs.items()
+        }
+        all_docs = [doc for docs in selected.values() for doc in docs]
+        if not all_docs:
+            return {
+                "answer": "I couldn't find relevant information in the uploaded documents.",
+                "sources": []
+            }
+        
+        prompts = {
+            company: self.build_prompt(
+                self.format_docs(docs),
+                f"{query}\n\nCover only {company}; the other companies are analyzed separately."
+            )
+            for company, docs in selected.items()
+            if docs
+        }
+        responses = await self.llm.abatch(
+            list(prompts.values()), config={"max_concurrency": len(prompts)}
+        )
+        
+        analyses = {
+            company: f"No relevant information about {company} was found in the uploaded documents."
+            for company in selected
+        }
+        analyses.update(zip(prompts, (response.content for response in responses)))
+        
+        answer = await self._generate(self.build_synthesis_prompt(analyses, query), on_token)
+        return self._result(answer, all_docs)
\ No newline at end of file
@@ -0,0 +1,120 @@
+# src/query_cache.py
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+import re
+import threading
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9&]+")
+
+
+class QueryCache:
+    """
+    Bounded, thread-safe LRU of analysis results.
+    Keys are the whitespace/case-normalized question, any forced companies and
+    a fingerprint of the document corpus it was answered from, so repeating a
+    question (or a comparison) over the same documents skips retrieval and the
+    LLM call - and loading more documents naturally misses.
+    When a query embedding is supplied, a paraphrase whose cosine similarity to
+    a cached question reaches `similarity_threshold` is also a hit - but only
+    if both questions mention the same numbers (years, quarters, amounts), the
+    same companies and the same metrics. Embeddings barely separate "Tesla
+    revenue in 2023" from "... in 2022" or "Tesla R&D spending in 2023", so
+    those must never share an answer.
+    `entity_terms` maps lowercase names/tickers to a canonical company;
+    `metric_terms` are lowercase substrings such as "revenue" or "r&d".
+    """
+
+    def __init__(self, max_size: int = 256, similarity_threshold: float = 0.95,
+                 entity_terms: Dict[str, str] = None, metric_terms: Sequence[str] = ()):
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.entity_terms = entity_terms or {}
+        self.metric_terms = tuple(metric_terms)
+        self._results: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._vectors: Dict[Tuple, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query: str, force_companies: List[str] = None, corpus: str = "") -> Tuple:
+        normalized = " ".join(query.lower().split())
+        companies = tuple(c.strip().lower() for c in force_companies or ())
+        return normalized, companies, corpus
+
+    def _signature(self, normalized_query: str) -> Tuple[FrozenSet[str], ...]:
+        """Numbers, companies and metrics a question mentions; paraphrase hits need an exact match"""
+        tokens = _TOKEN_RE.findall(normalized_query)
+        numbers = frozenset(t for t in tokens if any(ch.isdigit() for ch in t))
+        companies = frozenset(self.entity_terms[t] for t in tokens if t in self.entity_terms)
+        metrics = frozenset(m for m in self.metric_terms if m in normalized_query)
+        return numbers, companies, metrics
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _semantic_match(self, key: Tuple, query_vector: Sequence[float]) -> Optional[Tuple]:
+        """Most similar cached question with the same signature and corpus, if close enough"""
+        signature = self._signature(key[0])
+        candidates = [
+            k for k in self._vectors
+            if k[1:] == key[1:] and self._signature(k[0]) == signature
+        ]
+        if not candidates:
+            return None
+
+        # One matrix-vector product over all candidates (N < max_size)
+        similarities = np.stack([self._vectors[k] for k in candidates]) @ self._unit(query_vector)
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return candidates[best]
+        return None
+
+    def get(self, query: str, force_companies: List[str] = None,
+            query_vector: Sequence[float] = None, corpus: str = "") -> Optional[Dict]:
+        """Return the cached result for this question (or a close paraphrase), or None on a miss"""
+        key = self._key(query, force_companies, corpus)
+        with self._lock:
+            if key not in self._results and query_vector is not None:
+                key = self._semantic_match(key, query_vector)
+
+            if key is None or key not in self._results:
+                return None
+            self._results.move_to_end(key)
+            return self._results[key]
+
+    def put(self, query: str, result: Dict, force_companies: List[str] = None,
+            query_vector: Sequence[float] = None, corpus: str = ""):
+        """Store a result, evicting the least recently used entry when full"""
+        # Errors and empty retrievals are worth retrying, not remembering
+        if not result.get("sources"):
+            return
+
+        key = self._key(query, force_companies, corpus)
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            if query_vector is not None:
+                self._vectors[key] = self._unit(query_vector)
+
+            while len(self._results) > self.max_size:
+                evicted, _ = self._results.popitem(last=False)
+                self._vectors.pop(evicted, None)
+
+    def discard_corpus(self, corpus: str):
+        """Forget every answer computed from one corpus, e.g. when its session resets"""
+        with self._lock:
+            for key in [k for k in self._results if k[2] == corpus]:
+                del self._results[key]
+                self._vectors.pop(key, None)
+
+    def clear(self):
+        """Forget everything"""
+        with self._lock:
+            self._results.clear()
+            self._vectors.clear()
+
+    def __len__(self):
+        return len(self._results)
@@ -1,44 +1,145 @@
 # src/vector_store.py - PRODUCTION READY
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
-from typing import List, Dict
-import os
-import streamlit as st
+from blake3 import blake3
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Tuple
+import sys
+import uuid
+from src.config import get_openai_api_key
+from src.embeddings import get_embeddings
+
+# HNSW index settings per speed/accuracy trade-off. Corpora here are a few
+# thousand chunks, so small graphs and a modest search beam are plenty.
+HNSW_PRESETS = {
+    "fast": {"hnsw:M": 8, "hnsw:construction_ef": 64, "hnsw:search_ef": 20},
+    "balanced": {"hnsw:M": 16, "hnsw:construction_ef": 64, "hnsw:search_ef": 40},
+    "accurate": {"hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 100},
+}
+
+# Chunks per embed-then-add step when ingesting
+INSERT_BATCH_SIZE = 256
+
+
+@lru_cache(maxsize=256)
+def company_key(company: str) -> str:
+    """Normalized company name stored alongside 'company' for exact-match filters"""
+    # Interned and memoized: ingest calls this once per chunk with a handful of names
+    return sys.intern(company.strip().lower())
+
+
+def company_filter(company: str) -> Dict:
+    """Chroma where-clause matching one company's chunks, applied before ANN ranking"""
+    return {"company_key": company_key(company)}
+
+
+def chunk_hash(doc: Dict) -> str:
+    """Stable content address of a chunk, used as its vector store id"""
+    company = doc["metadata"].get("company", "")
+    return blake3(f"{company}\0{doc['content']}".encode()).hexdigest()
+
 
 class FinancialVectorStore:
     """
     In-memory vector store for financial documents.
-    No disk persistence - state is maintained via st.session_state.processed_chunks
+    No disk persistence - the Chroma collection is the only copy of the
+    chunks, kept alive via st.session_state.vector_store
     """
     
-    def __init__(self):
-        # Get API key from Streamlit secrets or environment
-        try:
-            api_key = st.secrets["OPENAI_API_KEY"]
-        except (KeyError, FileNotFoundError):
-            api_key = os.getenv("OPENAI_API_KEY")
-        
-        if not api_key:
-            raise ValueError(
-                "OpenAI API key not found. "
-                "Set OPENAI_API_KEY in .env or Streamlit secrets."
-            )
+    def __init__(self, hnsw_preset: str = "balanced"):
+        # Fail early without a key (Streamlit secrets or environment)
+        get_openai_api_key()
         
-        os.environ["OPENAI_API_KEY"] = api_key
+        # Shared embeddings client (created once per process)
+        self.embeddings = get_embeddings()
         
-        # Initialize embeddings
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small"  # Cost-effective embedding model
-        )
+        if hnsw_preset not in HNSW_PRESETS:
+            raise ValueError(f"Unknown HNSW preset '{hnsw_preset}'. Use one of {list(HNSW_PRESETS)}.")
+        self.hnsw_preset = hnsw_preset
         
         self.vectorstore = None
+        # Chroma's in-memory client is process-wide; a private collection keeps
+        # rebuilds and concurrent sessions from reading each other's chunks
+        self.collection_name = f"financial_docs_{uuid.uuid4().hex}"
+        # Bumped whenever chunks are added, so callers can invalidate caches
+        self.version = 0
+        # XOR of all chunk ids: order-independent and updated per insert
+        self._id_xor = 0
+    
+    def _new_documents(self, documents: List[Dict]) -> Tuple[List[str], List[str], List[Dict]]:
+        """Drop chunks already embedded (or repeated in the batch); return ids, texts, metadatas"""
+        unique = {}
+        for doc in documents:
+            unique.setdefault(chunk_hash(doc), doc)
+        
+        if self.vectorstore and unique:
+            existing = self.vectorstore.get(ids=list(unique), include=[])["ids"]
+            for doc_id in existing:
+                del unique[doc_id]
+        
+        ids = list(unique)
+        texts = [doc["content"] for doc in unique.values()]
+        # Chroma's where-filters are case-sensitive; a normalized key lets
+        # per-company searches filter in the index instead of in Python.
+        # content_hash travels with every search hit as a stable dedup key.
+        metadatas = [
+            dict(
+                doc["metadata"],
+                company_key=company_key(doc["metadata"].get("company", "")),
+                content_hash=doc_id
+            )
+            for doc_id, doc in unique.items()
+        ]
+        return ids, texts, metadatas
+    
+    def _insert(self, ids: List[str], texts: List[str], metadatas: List[Dict],
+                persist_embeddings: bool = False):
+        """
+        Embed (through the disk-backed embedding cache) and add to the collection.
+        
+        Batches are embedded on worker threads while earlier batches are being
+        added, so ingest takes about max(embed, insert) rather than the sum.
+        """
+        collection = self.vectorstore._collection
+        starts = range(0, len(texts), INSERT_BATCH_SIZE)
+        # Remote APIs take several requests at once; local models get one worker
+        workers = max(1, getattr(self.embeddings, "parallel_requests", 1))
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            embedded = executor.map(
+                lambda start: self.embeddings.embed_documents(
+                    texts[start:start + INSERT_BATCH_SIZE], persist=persist_embeddings
+                ),
+                starts
+            )
+            # map() yields in submission order: batch i is added while later ones embed
+            for start, embeddings in zip(starts, embedded):
+                end = start + INSERT_BATCH_SIZE
+                collection.add(
+                    ids=ids[start:end],
+                    embeddings=embeddings,
+                    metadatas=metadatas[start:end],
+                    documents=texts[start:end]
+                )
+                for doc_id in ids[start:end]:
+                    self._id_xor ^= int(doc_id, 16)
+    
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the set of chunks in the store. Ids are content hashes, so
+        two stores holding the same documents share a fingerprint.
+        """
+        return f"{self._id_xor:064x}"
     
-    def create_vectorstore(self, documents: List[Dict]):
+    def create_vectorstore(self, documents: List[Dict], persist_embeddings: bool = False):
         """
         Create in-memory vector store from documents.
         
         Args:
             documents: List of dicts with 'content' and 'metadata' keys
+            persist_embeddings: Also save new vectors to the on-disk embedding
+                cache (bundled demo documents only, never uploads)
             
         Returns:
             Chroma vectorstore instance
@@ -48,22 +149,61 @@ class FinancialVectorStore:
             raise ValueError("No documents provided to create vector store")
         
         # Extract texts and metadata
-        texts = [doc["content"] for doc in documents]
-        metadatas = [doc["metadata"] for doc in documents]
+        ids, texts, metadatas = self._new_documents(documents)
         
         if not texts:
             raise ValueError("No text content in documents")
         
         # Create in-memory vector store (no persistence)
-        self.vectorstore = Chroma.from_texts(
-            texts=texts,
-            embedding=self.embeddings,
-            metadatas=metadatas
+        self.vectorstore = Chroma(
+            collection_name=self.collection_name,
+            embedding_function=self.embeddings,
+            collection_metadata={"hnsw:space": "cosine", **HNSW_PRESETS[self.hnsw_preset]}
             # Note: NO persist_directory - keeps everything in memory
         )
+        self._insert(ids, texts, metadatas, persist_embeddings)
+        self.version += 1
         
         return self.vectorstore
     
+    def add_documents(self, documents: List[Dict], persist_embeddings: bool = False):
+        """
+        Embed and append new documents to the existing vector store.
+        
+        Only the given documents are embedded, so callers should pass the
+        newly processed chunks rather than everything loaded so far. Chunks
+        whose content hash is already in the collection are skipped.
+        
+        Args:
+            documents: List of dicts with 'content' and 'metadata' keys
+            persist_embeddings: See create_vectorstore
+            
+        Returns:
+            Number of chunks actually embedded
+        """
+        if not self.vectorstore:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        
+        ids, texts, metadatas = self._new_documents(documents)
+        if texts:
+            self._insert(ids, texts, metadatas, persist_embeddings)
+            self.version += 1
+        
+        return len(texts)
+    
+    def count(self) -> int:
+        """Number of chunks in the collection"""
+        if not self.vectorstore:
+            return 0
+        return self.vectorstore._collection.count()
+    
+    def clear(self):
+        """Drop this store's collection from the shared in-memory Chroma client"""
+        if self.vectorstore:
+            self.vectorstore.delete_collection()
+            self.vectorstore = None
+            self._id_xor = 0
+    
     def similarity_search(self, query: str, k: int = 4, filter_dict: Dict = None):
         """
         Search for similar documents.
@@ -82,4 +222,14 @@ class FinancialVectorStore:
         if filter_dict:
             return self.vectorstore.similarity_search(query, k=k, filter=filter_dict)
         
-        return self.vectorstore.similarity_search(query, k=k)
\ No newline at end of file
+        return self.vectorstore.similarity_search(query, k=k)
+    
+    async def asimilarity_search(self, query: str, k: int = 4, filter_dict: Dict = None):
+        """Async version of similarity_search"""
+        if not self.vectorstore:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        
+        if filter_dict:
+            return await self.vectorstore.asimilarity_search(query, k=k, filter=filter_dict)
+        
+        return await self.vectorstore.asimilarity_search(query, k=k)
\ No newline at end of file
@@ -0,0 +1,340 @@
+# tests/test_basic.py - offline checks (no API key, network or Streamlit server)
+import os
+import sys
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# Add parent directory to path so Python can find 'src'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import llm_chain, vector_store
+from src.document_processor import DocumentProcessor
+from src.embeddings import CachedEmbeddings, embedding_slices
+from src.keywords import COMPANY_KEYWORDS, METRICS, _COMPANY_RE, extract_company_name
+from src.llm_chain import DOC_HEADER_TOKENS, FinancialAnalystChain, _ApproxEncoding
+from src.query_cache import QueryCache
+from src.vector_store import FinancialVectorStore
+
+RESULT = {"answer": "cached", "sources": [{"content": "x", "metadata": {}}]}
+ENTITY_TERMS = {keyword.lower(): company for keyword, company in COMPANY_KEYWORDS.items()}
+
+
+def _chunk(company: str, content: str) -> dict:
+    return {"content": content, "metadata": {"company": company, "source": f"{company}.pdf"}}
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Fake model that records how many texts it was asked to embed"""
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def processor(monkeypatch, tmp_path):
+    """DocumentProcessor with a fake extractor and its chunk cache under tmp_path"""
+    processor = DocumentProcessor(num_workers=1)
+    processor._chunk_cache_dir = tmp_path / ".chunk_cache"
+    monkeypatch.setattr(processor, "extract_text_from_pdf",
+                        lambda path: "Revenue grew 20%.\n\nMargins improved.")
+    pdf = tmp_path / "report.pdf"
+    pdf.write_bytes(b"%PDF-1.4 not really parsed")
+    return processor, str(pdf)
+
+
+@pytest.fixture
+def make_store(monkeypatch, tmp_path):
+    """FinancialVectorStore factory backed by fake embeddings and a throwaway cache file"""
+    embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=16), "fake",
+                                  cache_path=tmp_path / "embed_cache.db")
+    monkeypatch.setattr(vector_store, "get_openai_api_key", lambda: "sk-test")
+    monkeypatch.setattr(vector_store, "get_embeddings", lambda: embeddings)
+
+    stores = []
+
+    def make():
+        store = FinancialVectorStore()
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.clear()
+
+
+# ============================================
+# On-disk caches hold bundled documents only
+# ============================================
+
+def test_uploads_are_not_hashed_or_cached(processor, monkeypatch):
+    processor, pdf = processor
+    monkeypatch.setattr(processor, "_cache_key", lambda path: pytest.fail("upload was hashed"))
+
+    chunks = processor.process_document(pdf, "10-K", "Tesla")
+
+    assert chunks and chunks[0]["metadata"]["company"] == "Tesla"
+    assert not processor._chunk_cache_dir.exists()
+
+
+def test_bundled_documents_are_cached(processor, monkeypatch):
+    processor, pdf = processor
+    chunks = processor.process_document(pdf, "10-K", "Tesla", cache_chunks=True)
+    assert len(list(processor._chunk_cache_dir.glob("*.pkl"))) == 1
+
+    monkeypatch.setattr(processor, "extract_text_from_pdf",
+                        lambda path: pytest.fail("cached PDF was re-extracted"))
+    cached = processor.process_document(pdf, "Annual Report", "TSLA", cache_chunks=True)
+
+    assert [c["content"] for c in cached] == [c["content"] for c in chunks]
+    assert cached[0]["metadata"]["type"] == "Annual Report"
+    assert cached[0]["metadata"]["company"] == "TSLA"
+
+
+def test_embeddings_persist_only_on_request(tmp_path):
+    cache_path = tmp_path / "embed_cache.db"
+    model = CountingEmbeddings(size=8)
+    embeddings = CachedEmbeddings(model, "fake", cache_path=cache_path)
+
+    vectors = embeddings.embed_documents(["uploaded chunk", "uploaded chunk"])
+    assert vectors[0] == vectors[1] and model.calls == 1
+    assert not cache_path.exists()
+
+    embeddings.embed_documents(["bundled chunk"], persist=True)
+    assert cache_path.exists()
+
+    # A fresh instance (e.g. after a restart) reads bundled vectors from disk
+    model = CountingEmbeddings(size=8)
+    restarted = CachedEmbeddings(model, "fake", cache_path=cache_path)
+    restarted.embed_documents(["bundled chunk", "uploaded chunk"])
+    assert model.calls == 1
+
+
+# ============================================
+# Embedding request slices
+# ============================================
+
+def test_embedding_slices_respects_item_limit():
+    texts = [f"chunk {i}" for i in range(5)]
+    slices = list(embedding_slices(texts, max_items=2))
+    assert slices == [texts[0:2], texts[2:4], texts[4:5]]
+
+
+def test_embedding_slices_respects_token_limit():
+    texts = ["a" * 30, "b" * 30, "c" * 30]  # 11 estimated tokens each
+    slices = list(embedding_slices(texts, max_tokens=25))
+    assert slices == [texts[0:2], texts[2:3]]
+
+
+def test_embedding_slices_keeps_oversized_text_alone():
+    texts = ["short", "x" * 300, "short"]
+    slices = list(embedding_slices(texts, max_tokens=50))
+    assert slices == [["short"], ["x" * 300], ["short"]]
+    assert list(embedding_slices([])) == []
+
+
+# ============================================
+# Incremental vector store updates
+# ============================================
+
+def test_vector_store_skips_duplicate_chunks(make_store):
+    store = make_store()
+    tesla = _chunk("Tesla", "Revenue grew.")
+    store.create_vectorstore([tesla, tesla, _chunk("Apple", "Revenue grew.")])
+
+    # Same text under another company is a different chunk
+    assert store.count() == 2
+    assert store.add_documents([tesla]) == 0
+    assert store.version == 1
+
+    added = store.add_documents([tesla, _chunk("Nvidia", "GPUs sold out."), _chunk("Nvidia", "GPUs sold out.")])
+    assert added == 1
+    assert store.count() == 3
+    assert store.version == 2
+
+
+# ============================================
+# Query-result cache
+# ============================================
+
+def test_query_cache_normalizes_and_evicts_lru():
+    cache = QueryCache(max_size=2)
+    cache.put("Tesla revenue", RESULT)
+    cache.put("Apple revenue", RESULT)
+
+    assert cache.get("  tesla   REVENUE ") is RESULT  # Tesla is now most recent
+    cache.put("Nvidia revenue", RESULT)
+
+    assert len(cache) == 2
+    assert cache.get("Apple revenue") is None
+    assert cache.get("Tesla revenue") is RESULT
+    assert cache.get("Nvidia revenue") is RESULT
+
+
+def test_query_cache_skips_results_without_sources():
+    cache = QueryCache()
+    cache.put("Tesla revenue", {"answer": "Error: timeout", "sources": []})
+    assert cache.get("Tesla revenue") is None
+
+
+def test_query_cache_keys_on_forced_companies():
+    cache = QueryCache()
+    cache.put("Compare revenue", RESULT, force_companies=["Tesla", "Apple"])
+
+    assert cache.get("Compare revenue", ["tesla ", "APPLE"]) is RESULT
+    assert cache.get("Compare revenue", ["Tesla", "Nvidia"]) is None
+    assert cache.get("Compare revenue") is None
+
+
+# ============================================
+# Semantic (paraphrase) hits
+# ============================================
+
+def test_query_cache_semantic_match():
+    cache = QueryCache(similarity_threshold=0.95, entity_terms=ENTITY_TERMS, metric_terms=METRICS)
+    cache.put("What was Tesla revenue?", RESULT, query_vector=[1.0, 0.0], corpus="a")
+
+    assert cache.get("How much revenue did Tesla make?", query_vector=[0.99, 0.05], corpus="a") is RESULT
+    assert cache.get("How much revenue did Tesla make?", query_vector=[0.5, 0.5], corpus="a") is None
+    assert cache.get("How much revenue did Tesla make?", query_vector=[0.99, 0.05], corpus="b") is None
+    # Without a vector only exact (normalized) questions hit
+    assert cache.get("How much revenue did Tesla make?", corpus="a") is None
+
+
+@pytest.mark.parametrize("question", [
+    "What was Tesla revenue in 2022?",
+    "What was Apple revenue in 2023?",
+    "What was Tesla revenue in 2023 and 2024?",
+    "What was Tesla R&D spending in 2023?",
+])
+def test_query_cache_semantic_match_needs_same_numbers_companies_and_metrics(question):
+    cache = QueryCache(entity_terms=ENTITY_TERMS, metric_terms=METRICS)
+    vector = [1.0, 0.0]
+    cache.put("What was Tesla revenue in 2023?", RESULT, query_vector=vector)
+
+    # Identical vectors: only the signature can tell these apart
+    assert cache.get(question, query_vector=vector) is None
+    # Tickers count as the company they stand for
+    assert cache.get("TSLA revenue for 2023?", query_vector=vector) is RESULT
+
+
+# ============================================
+# Answer cache keyed by corpus
+# ============================================
+
+def test_query_cache_isolates_corpus():
+    cache = QueryCache()
+    cache.put("Tesla revenue", RESULT, corpus="a")
+    cache.put("Tesla revenue", RESULT, corpus="b")
+
+    assert cache.get("Tesla revenue", corpus="a") is RESULT
+    assert cache.get("Tesla revenue", corpus="c") is None
+
+    cache.discard_corpus("a")
+    assert cache.get("Tesla revenue", corpus="a") is None
+    assert cache.get("Tesla revenue", corpus="b") is RESULT
+
+
+def test_fingerprint_identifies_chunk_set(make_store):
+    chunks = [_chunk("Tesla", "Revenue grew."), _chunk("Apple", "Margins fell.")]
+    first, second = make_store(), make_store()
+    first.create_vectorstore(chunks)
+    second.create_vectorstore(chunks[::-1])
+
+    # Same chunks in any order share a fingerprint
+    assert first.fingerprint == second.fingerprint
+
+    before = first.fingerprint
+    first.add_documents(chunks)
+    assert first.fingerprint == before
+
+    first.add_documents([_chunk("Nvidia", "Data center sales doubled.")])
+    assert first.fingerprint != before
+
+    first.clear()
+    assert first.fingerprint == "0" * 64
+
+
+# ============================================
+# Context selection
+# ============================================
+
+@pytest.fixture
+def chain(monkeypatch):
+    """Chain with only what select_context needs: no vector store, key or LLM client"""
+    monkeypatch.setattr(llm_chain, "_token_encoding", lambda model_name: _ApproxEncoding())
+    chain = FinancialAnalystChain.__new__(FinancialAnalystChain)
+    chain.model_name = "gpt-4o-mini"
+    return chain
+
+
+def _doc(company: str, content: str) -> Document:
+    return Document(page_content=content, metadata={"company": company})
+
+
+def test_select_context_round_robin_and_cap(chain):
+    docs = [_doc("Tesla", "t1"), _doc("Tesla", "t2"), _doc("Tesla", "t3"),
+            _doc("Apple", "a1"), _doc("Nvidia", "n1")]
+
+    selected = chain.select_context(docs, budget=10_000, max_docs=4)
+
+    assert [d.page_content for d in selected] == ["t1", "a1", "n1", "t2"]
+
+
+def test_select_context_truncates_overflowing_doc_at_sentence(chain):
+    first = _doc("Tesla", "x" * 160)  # 40 tokens
+    long = _doc("Apple", "Revenue grew strongly this year. " * 60)
+    last = _doc("Tesla", "never reached")
+    first_cost = 40 + DOC_HEADER_TOKENS
+
+    selected = chain.select_context([first, long, last], budget=first_cost + DOC_HEADER_TOKENS + 120)
+
+    assert [d.metadata["company"] for d in selected] == ["Tesla", "Apple"]
+    truncated = selected[1].page_content
+    assert len(truncated) <= 120 * 4
+    assert truncated.endswith(".")
+    assert long.page_content.startswith(truncated)
+
+
+def test_select_context_drops_overflowing_doc_when_too_little_room(chain):
+    first = _doc("Tesla", "x" * 160)
+    long = _doc("Apple", "Revenue grew strongly this year. " * 60)
+    first_cost = 40 + DOC_HEADER_TOKENS
+
+    selected = chain.select_context([first, long], budget=first_cost + DOC_HEADER_TOKENS + 50)
+
+    assert selected == [first]
+
+
+# ============================================
+# Company names in filenames
+# ============================================
+
+@pytest.mark.parametrize("text, expected", [
+    ("TESLA_10K", "TESLA"),
+    ("AppleInc", "Apple"),        # names and tickers match inside words
+    ("NVDAearnings", "NVDA"),
+    ("FB_10K", "FB"),             # "_" is a word char, \b would miss this
+    ("FBX Holdings", None),       # short ticker followed by a letter
+    ("AcmeFB report", None),      # short ticker preceded by a letter
+])
+def test_company_regex(text, expected):
+    match = _COMPANY_RE.search(text)
+    assert (match.group(1) if match else None) == expected
+
+
+@pytest.mark.parametrize("filename, expected", [
+    ("10-K TESLA.pdf", "Tesla"),
+    ("EC-AAPL_2024.PDF", "Apple"),
+    ("TeslaQ3_2024.pdf", "Tesla"),
+    ("AppleInc_10K.pdf", "Apple"),
+    ("NVDAearnings.pdf", "Nvidia"),
+    ("GoogleAR.pdf", "Google"),
+    ("Q3_2024_Acme_Report.pdf", "Acme"),
+    ("FBXcorp.pdf", "Fbxcorp"),
+])
+def test_extract_company_name(filename, expected):
+    assert extract_company_name(filename) == expected